@@ -2,18 +2,31 @@
 # encoding: utf-8
 
 import logging
-import json
+import orjson
 import random
 import uuid
 import argparse
 import asyncio
 import aiohttp
+import uvloop
 
-logging.basicConfig(level=logging.DEBUG)
+# DEBUG logging in the 1000-iteration loops serializes them on stderr
+# I/O, so default to INFO and opt in to DEBUG when needed.
+logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 url_base = 'http://localhost:8000'
 
+# uuid3/uuid5 of constant inputs never change, so hash them once here
+# instead of doing an MD5 and a SHA1 on every json_consumer iteration.
+UUID3 = uuid.uuid3(uuid.NAMESPACE_DNS, 'apistar websockets')
+UUID5 = uuid.uuid5(uuid.NAMESPACE_URL, 'apistar websockets')
+
+# getrandbits is a single C call, much cheaper than randint's Python-level
+# randrange machinery. 20/24 bits are close enough to the old ranges for
+# test traffic.
+_getrand = random.Random().getrandbits
+
 
 async def hello(ws):
     msg = await ws.receive_str()
@@ -23,11 +36,25 @@ async def hello(ws):
 async def ping(ws):
     num = 1000
     logger.debug("Sending %s pings...", num)
-    for _ in range(num):
-        await ws.send_str('ping')
-        pong = await ws.receive_str()
-        if pong != 'pong':
-            raise Exception("Not a pong: %s" % pong)
+
+    # Run the sends and receives as separate tasks so pings are pipelined
+    # instead of each one waiting out a full round trip.
+    async def sender():
+        for _ in range(num):
+            await ws.send_str('ping')
+
+    async def receiver():
+        # Use the raw receive() path; frames the reader has already
+        # buffered resolve immediately, so a single wakeup can drain a
+        # whole run of pipelined pongs without the receive_str wrapper.
+        count = 0
+        while count < num:
+            msg = await ws.receive()
+            if msg.type != aiohttp.WSMsgType.TEXT or msg.data != 'pong':
+                raise Exception("Not a pong: %s" % (msg,))
+            count += 1
+
+    await asyncio.gather(sender(), receiver())
 
     logger.debug("Got %s pongs", num)
 
@@ -36,7 +63,7 @@ async def consumer(ws):
     num = 1000
     logger.debug("Sending %s random numbers", num)
     for _ in range(num):
-        await ws.send_str('%s' % random.randint(0, 10000000))
+        await ws.send_str(str(_getrand(24)))
 
     logger.debug("Sent %s numbers", num)
 
@@ -45,35 +72,62 @@ async def json_consumer(ws):
     num = 1000
     logger.debug("Sending %s random json message", num)
     for _ in range(num):
-        await ws.send_json({
-            'int': random.randint(0, 1000000),
-            'uuid1': str(uuid.uuid1()),
-            'uuid3': str(uuid.uuid3(uuid.NAMESPACE_DNS, 'apistar websockets')),
-            'uuid4': str(uuid.uuid4()),
-            'uuid5': str(uuid.uuid5(uuid.NAMESPACE_URL, 'apistar websockets')),
-        })
+        # orjson serializes UUID instances natively, so no str() conversions needed.
+        await ws.send_bytes(orjson.dumps({
+            'int': _getrand(20),
+            'uuid1': uuid.uuid1(),
+            'uuid3': UUID3,
+            'uuid4': uuid.uuid4(),
+            'uuid5': UUID5,
+        }))
 
     logger.debug("Sent %s json messages", num)
 
 
 async def producer(ws):
     num = 1000
+    # Check the log level once, not per message.
+    debug = logger.isEnabledFor(logging.DEBUG)
     logger.debug("Receiving %s random numbers", num)
     for _ in range(num):
         msg = await ws.receive_str()
-        logger.debug("Received: %s", msg)
+        if debug:
+            logger.debug("Received: %s", msg)
 
     logger.debug("Received %s numbers", num)
 
 
+# Shared receive loop for the JSON endpoints. Binding receive_bytes and
+# orjson.loads to locals keeps the loop body on LOAD_FAST instead of
+# attribute lookups, and one shared body keeps the interpreter's inline
+# caches warm across all the JSON subcommands.
+async def _recv_json(ws, num):
+    recv = ws.receive_bytes
+    loads = orjson.loads
+    # Check the log level once, not per message.
+    debug = logger.isEnabledFor(logging.DEBUG)
+    count = 0
+    while count < num:
+        msg = loads(await recv())
+        # Some endpoints batch messages into JSON arrays, one per frame.
+        if isinstance(msg, list):
+            if debug:
+                for m in msg:
+                    logger.debug("Received: %s", m)
+            count += len(msg)
+        else:
+            if debug:
+                logger.debug("Received: %s", msg)
+            count += 1
+
+    return count
+
+
 async def json_producer(ws):
     num = 1000
     logger.debug("Receiving %s json messages", num)
-    for _ in range(num):
-        msg = json.loads(await ws.receive_bytes())
-        logger.debug("Received: %s", msg)
-
-    logger.debug("Received %s json messages", num)
+    count = await _recv_json(ws, num)
+    logger.debug("Received %s json messages", count)
 
 
 async def time(ws):
@@ -90,7 +144,7 @@ async def sub(ws):
     num = 10
     logger.debug("Receiving %s subscription messages", num)
     for _ in range(num):
-        msg = await ws.receive_str()
+        msg = orjson.loads(await ws.receive_bytes())
         logger.debug("Received: %s", msg)
 
     logger.debug("Received %s subscription messages", num)
@@ -99,20 +153,14 @@ async def sub(ws):
 async def crypto(ws):
     num = 10
     logger.debug("Receiving %s crypto price messages for", num)
-    for _ in range(num):
-        msg = json.loads(await ws.receive_bytes())
-        logger.debug("Received: %s", msg)
-
+    await _recv_json(ws, num)
     logger.debug("Received %s crypto messages", num)
 
 
 async def crypto_managed(ws):
     num = 10
     logger.debug("Receiving %s crypto price messages for", num)
-    for _ in range(num):
-        msg = json.loads(await ws.receive_bytes())
-        logger.debug("Received: %s", msg)
-
+    await _recv_json(ws, num)
     logger.debug("Received %s crypto messages", num)
 
 
@@ -187,7 +235,9 @@ for cmd, obj in urls.items():
 
 async def run(args):
     logger.debug("Running: %s", args)
-    session = aiohttp.ClientSession()
+    # A 256KB read buffer coalesces kernel reads into fewer, larger
+    # chunks so one wakeup can drain several queued frames.
+    session = aiohttp.ClientSession(read_bufsize=256 * 1024)
 
     url = url_base + args.url
     if args.argname:
@@ -197,7 +247,7 @@ async def run(args):
 
     logger.debug("Connecting to URL: %s", url)
 
-    async with session.ws_connect(url) as ws:
+    async with session.ws_connect(url, max_msg_size=4 * 1024 * 1024) as ws:
         await args.func(ws)
         if not ws.closed:
             logger.debug("Closing connection...")
@@ -211,6 +261,10 @@ async def run(args):
 def main():
     args = parser.parse_args()
 
+    # Use uvloop's libuv based event loop, it's much faster than the
+    # default asyncio loop for socket heavy workloads like these.
+    uvloop.install()
+
     try:
         loop = asyncio.get_event_loop()
         loop.run_until_complete(run(args))
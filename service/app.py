@@ -1,6 +1,12 @@
+import uvloop
+
 from apistar import ASyncApp
 from handlers import routes, WebSocketEvents
 
+# Use uvloop's libuv based event loop, it's much faster than the
+# default asyncio loop for socket heavy workloads like these.
+# If the ASGI server is uvicorn, `--loop uvloop` does the same thing.
+uvloop.install()
 
 app = ASyncApp(
     event_hooks=[WebSocketEvents],